@@ -7,7 +7,16 @@ in order to implement the strategy design pattern.
 
 import re
 
-from chatette.utils import rchop, UnitType
+from six.moves import filter
+
+try:
+    import re2
+    if not hasattr(re2, "Options"):  # Not `google-re2` (e.g. `pyre2`)
+        re2 = None
+except ImportError:
+    re2 = None
+
+from chatette.utils import UnitType
 from chatette.parsing.utils import \
     ALIAS_SYM, SLOT_SYM, INTENT_SYM, VARIATION_SYM, ESCAPEMENT_SYM
 from chatette.cli.terminal_writer import TerminalWriter, RedirectionType
@@ -17,8 +26,96 @@ from chatette.units.ast import AST
 
 REDIRECTION_SYM = ">"
 REDIRECTION_APPEND_SYM = ">>"
+_REDIRECTION_SYMS = frozenset((REDIRECTION_SYM, REDIRECTION_APPEND_SYM))
 
 REGEX_SYM = '/'
+REGEX_SPECIAL_CHARS = ".^$*+?{}[]\\|()"
+REGEX_OPTIONAL_QUANTIFIERS = "*?{"
+
+_UNIT_TYPES_FROM_STR = {
+    "alias": UnitType.alias, ALIAS_SYM: UnitType.alias,
+    "slot": UnitType.slot, SLOT_SYM: UnitType.slot,
+    "intent": UnitType.intent, INTENT_SYM: UnitType.intent,
+}
+
+# Character classes that only match ASCII characters with RE2,
+# while they also match other Unicode characters with `re`
+_RE2_ASCII_ONLY_CLASSES = re.compile(r"\\[wWdDsSbB]")
+
+_MAX_CACHED_REGEXES = 256
+_compiled_regexes = dict()
+
+
+def _compile_regex(pattern, ignorecase):
+    """
+    Returns the compiled regex for `pattern`
+    (case-insensitive if `ignorecase` is `True`).
+    If module `re2` (from `google-re2`) is installed, it is used to compile
+    `pattern`, as it guarantees matching in linear time, whatever the pattern.
+    Patterns it doesn't support, and patterns using character classes
+    (such as `\\w`) that RE2 would only match with ASCII characters,
+    are compiled with module `re` instead.
+    Compiled regexes are cached, so that commands that are repeated
+    in interactive mode don't compile the same pattern again.
+    """
+    key = (pattern, ignorecase)
+    regex = _compiled_regexes.get(key)
+    if regex is None:
+        if len(_compiled_regexes) >= _MAX_CACHED_REGEXES:
+            _compiled_regexes.clear()
+        if re2 is not None and not _RE2_ASCII_ONLY_CLASSES.search(pattern):
+            options = re2.Options()
+            options.case_sensitive = not ignorecase
+            options.log_errors = False
+            try:
+                regex = re2.compile(pattern, options)
+            except re2.error:
+                regex = None
+        if regex is None:
+            if ignorecase:
+                regex = re.compile(pattern, re.IGNORECASE)
+            else:
+                regex = re.compile(pattern)
+        _compiled_regexes[key] = regex
+    return regex
+
+
+def _get_literal_prefix(pattern):
+    """
+    Returns the literal string any string matched by `pattern`
+    (from its beginning) has to start with.
+    Returns an empty string if there is no such literal prefix
+    (or if it cannot be found by simply reading `pattern`).
+    """
+    # NOTE: inline flags (e.g. `(?i)`) can apply to the whole pattern
+    if '|' in pattern or "(?" in pattern:
+        return ""
+    if pattern.startswith('^'):
+        pattern = pattern[1:]
+    for (i, char) in enumerate(pattern):
+        if char in REGEX_SPECIAL_CHARS:
+            if char in REGEX_OPTIONAL_QUANTIFIERS:
+                # The previous character might not be matched
+                return pattern[:i-1] if i > 0 else ""
+            return pattern[:i]
+    return pattern
+
+
+def _iter_matching(relevant_dict, regex, use_search, prefix=""):
+    """
+    Returns an iterator over the names (keys) in `relevant_dict`
+    that match `regex`, either anywhere in the names if `use_search` is `True`
+    or from their beginning otherwise.
+    If `prefix` is not empty, only names that start with it are yielded.
+    """
+    matches = regex.search if use_search else regex.match
+    if prefix == "":
+        # NOTE: `filter` loops in C, which matters for large template files
+        return filter(matches, relevant_dict)
+    return (
+        name for name in relevant_dict
+        if name.startswith(prefix) and matches(name)
+    )
 
 
 class CommandStrategy(object):
@@ -30,61 +127,74 @@ class CommandStrategy(object):
                 CommandStrategy.find_redirection_file_path(self.command_tokens)
         if redirection_tuple is not None:
             self.remove_redirection_tokens()
-            (redirection_type, redirection_filepath) = redirection_tuple
-            self.print_wrapper = \
-                TerminalWriter(redirection_type, redirection_filepath)
+            self._redirection = redirection_tuple
         elif quiet:
-            self.print_wrapper = \
-                TerminalWriter(redirection_type=RedirectionType.quiet)
+            self._redirection = (RedirectionType.quiet, None)
         else:
-            self.print_wrapper = TerminalWriter(None)
+            self._redirection = (None, None)
+        # NOTE: the wrapper of print is only created when it is first used
+        self._print_wrapper = None
 
         self._is_regex_global = None
+        self._regex_prefix = ""
+
+    @property
+    def print_wrapper(self):
+        """
+        The wrapper of `print` to use to write the output of the command,
+        which takes the redirection of this command into account.
+        """
+        if self._print_wrapper is None:
+            (redirection_type, redirection_filepath) = self._redirection
+            self._print_wrapper = \
+                TerminalWriter(redirection_type, redirection_filepath)
+        return self._print_wrapper
 
     @staticmethod
     def tokenize(command_str):
-        """Tokenizes a string that is a command."""
-        splitted = command_str.split()
-        if len(splitted) == 0:
-            return []
-        if len(splitted) == 1:
-            return [splitted[0]]
+        """
+        Tokenizes a string that is a command.
+        Words are separated by whitespace, except inside double quotes and
+        regexes (where consecutive whitespace is replaced by a single space).
+        The words of such a token are only joined once its end was found.
+        """
         tokens = []
-        current_token = ""
+        token_words = None
         inside_token = False
-        inside_regex = False
-        for word in splitted:
-            if inside_token:
-                current_token += ' ' + word
-                if word.endswith('"') and (len(word) < 2 or word[-2] != '\\'):
-                    inside_token = False
-                    tokens.append(current_token.rstrip())
-                    current_token = ""
-            elif inside_regex:
-                current_token += ' ' + word
-                if CommandStrategy._is_end_regex(word):
-                    inside_regex = False
-                    tokens.append(current_token)
-                    current_token = ""
-            elif (
-                word.startswith('"') and word.endswith('"')
-                and (len(word) < 2 or word[-2] != '\\')
-            ):
-                tokens.append(word)
+        for word in command_str.split():
+            if token_words is not None:
+                token_words.append(word)
+                if inside_token:
+                    is_token_end = CommandStrategy._is_end_quoted_token(word)
+                else:
+                    is_token_end = CommandStrategy._is_end_regex(word)
+                if is_token_end:
+                    tokens.append(' '.join(token_words))
+                    token_words = None
             elif word.startswith('"'):
-                inside_token = True
-                current_token += word
-            elif word.startswith("/") and CommandStrategy._is_end_regex(word):
-                tokens.append(word)
-            elif word.startswith("/"):
-                inside_regex = True
-                current_token += word
-            else:  # not inside a token and not starting with "
+                if CommandStrategy._is_end_quoted_token(word):
+                    tokens.append(word)
+                else:
+                    token_words = [word]
+                    inside_token = True
+            elif word.startswith(REGEX_SYM):
+                if CommandStrategy._is_end_regex(word):
+                    tokens.append(word)
+                else:
+                    token_words = [word]
+                    inside_token = False
+            else:
                 tokens.append(word)
-        if current_token != "":
-            tokens.append(current_token.rstrip())
+        if token_words is not None:
+            tokens.append(' '.join(token_words))
         return tokens
     @staticmethod
+    def _is_end_quoted_token(word):
+        """
+        Returns `True` if `word` ends with a double quote that is not escaped.
+        """
+        return word.endswith('"') and (len(word) < 2 or word[-2] != '\\')
+    @staticmethod
     def _is_end_regex(word):
         """Returns `True` if `word` is the end of a regex."""
         return \
@@ -108,14 +218,19 @@ class CommandStrategy(object):
         """
         if len(tokens) < 2:
             return None
-        if tokens[-2] == REDIRECTION_APPEND_SYM:
-            return (RedirectionType.append, tokens[-1])
-        if tokens[-2] == REDIRECTION_SYM:
-            return (RedirectionType.truncate, tokens[-1])
+        last_token = tokens[-1]
+        second_last_token = tokens[-2]
+        # Most commands are not redirected: check the first characters only
         if (
-            tokens[-1] == REDIRECTION_APPEND_SYM
-            or tokens[-1] == REDIRECTION_SYM
+            not last_token.startswith(REDIRECTION_SYM)
+            and not second_last_token.startswith(REDIRECTION_SYM)
         ):
+            return None
+        if second_last_token == REDIRECTION_APPEND_SYM:
+            return (RedirectionType.append, last_token)
+        if second_last_token == REDIRECTION_SYM:
+            return (RedirectionType.truncate, last_token)
+        if last_token in _REDIRECTION_SYMS:
             return (RedirectionType.quiet, None)
         return None
 
@@ -126,14 +241,7 @@ class CommandStrategy(object):
         into the corresponding `UnitType` value.
         Returns `None` if there exist no corresponding `UnitType` value.
         """
-        unit_type_str = unit_type_str.lower()
-        if unit_type_str in ("alias", ALIAS_SYM):
-            return UnitType.alias
-        if unit_type_str in ("slot", SLOT_SYM):
-            return UnitType.slot
-        if unit_type_str in ("intent", INTENT_SYM):
-            return UnitType.intent
-        return None
+        return _UNIT_TYPES_FROM_STR.get(unit_type_str.lower())
 
 
     @staticmethod
@@ -182,47 +290,34 @@ class CommandStrategy(object):
         returns a compiled regex that is able to find all units with a name
         that matches some pattern.
         Returns `None` otherwise.
+        Also stores the literal prefix all matching unit names start with
+        (if it can be known), to filter out unit names before using the regex.
         """
-        if (
-            name.startswith(REGEX_SYM)
-            and (
-                name.endswith(REGEX_SYM)
-                or name[-2] == REGEX_SYM
-                or name[-3] == REGEX_SYM)
-        ):
-            splitted_str = [e for e in name.split(REGEX_SYM) if e != ""]
-            if len(splitted_str) == 1:
-                return re.compile(name[1:-1].replace('\\'+REGEX_SYM, REGEX_SYM))
-
-            flags = splitted_str[-1]
-            text_without_flags = rchop(name, flags)
-            self._is_regex_global = 'g' in flags
-            if 'i' in flags:
-                return re.compile(
-                    text_without_flags[1:-1].replace(
-                        '\\'+REGEX_SYM, REGEX_SYM
-                    ),
-                    re.IGNORECASE
-                )
-            return re.compile(
-                text_without_flags[1:-1].replace('\\'+REGEX_SYM, REGEX_SYM)
-            )
-        return None
+        if not name.startswith(REGEX_SYM):
+            return None
+        (head, _, flags) = name.rpartition(REGEX_SYM)
+        if head == "" or len(flags) > 2:  # No closing slash or too many flags
+            return None
+
+        pattern = head[1:]
+        if '\\'+REGEX_SYM in pattern:
+            pattern = pattern.replace('\\'+REGEX_SYM, REGEX_SYM)
+        self._is_regex_global = 'g' in flags
+        if self._is_regex_global or 'i' in flags:
+            self._regex_prefix = ""
+        else:
+            self._regex_prefix = _get_literal_prefix(pattern)
+        return _compile_regex(pattern, 'i' in flags)
 
     def next_matching_unit_name(self, unit_type, regex):
         """
         Yields the next unit name of type `unit_type`
         whose name matches `regex`.
         """
-        relevant_dict = AST.get_or_create()._get_relevant_dict(unit_type)
-        if self._is_regex_global:
-            for unit_name in relevant_dict:
-                if regex.search(unit_name):
-                    yield unit_name
-        else:
-            for unit_name in relevant_dict:
-                if regex.match(unit_name):
-                    yield unit_name
+        return _iter_matching(
+            AST.get_or_create()._get_relevant_dict(unit_type), regex,
+            self._is_regex_global, self._regex_prefix
+        )
     def get_all_matching_unit_names(self, unit_type, regex):
         """
         Returns a list of unit names of type `unit_type`
@@ -231,10 +326,7 @@ class CommandStrategy(object):
               returns the same data cannot be used in that case (dict changes
               size during iteration).
         """
-        relevant_dict = AST.get_or_create()[unit_type]
-        if self._is_regex_global:
-            return [name for name in relevant_dict if regex.search(name)]
-        return [name for name in relevant_dict if regex.match(name)]
+        return list(self.next_matching_unit_name(unit_type, regex))
 
     def remove_redirection_tokens(self):
         """
@@ -242,13 +334,11 @@ class CommandStrategy(object):
         from `self.command_tokens`.
         @pre: There are redirection tokens in the tokens.
         """
-        if (
-            self.command_tokens[-2] == REDIRECTION_APPEND_SYM
-            or self.command_tokens[-2] == REDIRECTION_SYM
-        ):
-            self.command_tokens = self.command_tokens[:-2]
+        tokens = self.command_tokens
+        if tokens[-2] in _REDIRECTION_SYMS:
+            self.command_tokens = tokens[:-2]
         else:
-            self.command_tokens = self.command_tokens[:-1]
+            self.command_tokens = tokens[:-1]
 
 
     def flush_output(self):
@@ -256,6 +346,8 @@ class CommandStrategy(object):
         Asks the wrapper of print to flush its outputs
         to the redirected file (if such a file exists).
         """
+        if self._print_wrapper is None and self._redirection[1] is None:
+            return  # Nothing was written and there is no file to create
         self.print_wrapper.flush()
 
 
@@ -286,13 +378,16 @@ class CommandStrategy(object):
             )
             return
 
-        unit_regex = self.get_regex_name(self.command_tokens[2])
+        unit_identifier = self.command_tokens[2]
+        # Most commands are given a unit name rather than a regex
+        if unit_identifier.startswith(REGEX_SYM):
+            unit_regex = self.get_regex_name(unit_identifier)
+        else:
+            unit_regex = None
         if unit_regex is None:
             try:
                 [unit_name, variation_name] = \
-                    CommandStrategy.split_exact_unit_name(
-                        self.command_tokens[2]
-                    )
+                    CommandStrategy.split_exact_unit_name(unit_identifier)
             except SyntaxError:
                 self.print_wrapper.error_log(
                     "Unit identifier couldn't be interpreted. " + \
@@ -301,8 +396,10 @@ class CommandStrategy(object):
             self.execute_on_unit(unit_type, unit_name, variation_name)
         else:
             count = 0
-            for unit_name in self.next_matching_unit_name(
-                unit_type, unit_regex
+            relevant_dict = AST.get_or_create()._get_relevant_dict(unit_type)
+            for unit_name in _iter_matching(
+                relevant_dict, unit_regex,
+                self._is_regex_global, self._regex_prefix
             ):
                 self.execute_on_unit(unit_type, unit_name)
                 count += 1
@@ -19,6 +19,11 @@ from chatette.units.modifiable.definitions.intent import IntentDefinition
 
 class AST(Singleton):
     _instance = None
+    _relevant_dict_attr = {
+        UnitType.alias: "_alias_definitions",
+        UnitType.slot: "_slot_definitions",
+        UnitType.intent: "_intent_definitions",
+    }
     def __init__(self):
         self._alias_definitions = dict()
         self._slot_definitions = dict()
@@ -29,13 +34,9 @@ class AST(Singleton):
 
     def _get_relevant_dict(self, unit_type):
         """Returns the dict that stores units of type `unit_type`."""
-        if unit_type == UnitType.alias:
-            return self._alias_definitions
-        elif unit_type == UnitType.slot:
-            return self._slot_definitions
-        elif unit_type == UnitType.intent:
-            return self._intent_definitions
-        else:
+        try:
+            return getattr(self, self._relevant_dict_attr[unit_type])
+        except KeyError:
             raise TypeError(
                 "Tried to get a definition with wrong type " + \
                 "(expected alias, slot or intent)"
@@ -8,10 +8,13 @@ import re
 import pytest
 
 from chatette.facade import Facade
-from chatette.cli.interactive_commands.command_strategy import CommandStrategy
+from chatette.cli.interactive_commands.command_strategy import \
+    CommandStrategy, _compile_regex, _get_literal_prefix
 from chatette.cli.terminal_writer import RedirectionType
 from chatette.utils import UnitType
 
+from chatette.units.ast import AST
+
 
 def get_facade():
     if not Facade.was_instantiated():
@@ -73,6 +76,25 @@ class TestTokenize(object):
         assert CommandStrategy.tokenize('test "escaped \\" was here"') == \
                ["test", '"escaped \\" was here"']
 
+    def test_inner_whitespace(self):
+        assert CommandStrategy.tokenize('word "a \t  name"  next') == \
+               ["word", '"a name"', "next"]
+        assert CommandStrategy.tokenize("regex /with   space/g end") == \
+               ["regex", "/with space/g", "end"]
+
+
+class TestIsEndQuotedToken(object):
+    def test_not_end(self):
+        assert not CommandStrategy._is_end_quoted_token("")
+        assert not CommandStrategy._is_end_quoted_token("word")
+        assert not CommandStrategy._is_end_quoted_token('"start')
+        assert not CommandStrategy._is_end_quoted_token('escaped\\"')
+
+    def test_end(self):
+        assert CommandStrategy._is_end_quoted_token('"')
+        assert CommandStrategy._is_end_quoted_token('end"')
+        assert CommandStrategy._is_end_quoted_token('"quoted"')
+
 
 class TestIsEndRegex(object):
     def test_empty(self):
@@ -182,27 +204,145 @@ class TestGetRegexName(object):
         assert CommandStrategy("").get_regex_name('"alias"') is None
         assert CommandStrategy("").get_regex_name('"something with/slash"') \
                is None
+        assert CommandStrategy("").get_regex_name("/") is None
+        assert CommandStrategy("").get_regex_name("/not/closed") is None
 
     def test_regex(self):
         assert CommandStrategy("").get_regex_name("/regex/") == \
-               re.compile("regex")
+               _compile_regex("regex", False)
         assert CommandStrategy("").get_regex_name("/test.*/") == \
-               re.compile("test.*")
+               _compile_regex("test.*", False)
         assert CommandStrategy("").get_regex_name("/some[0-9]/i") == \
-               re.compile("some[0-9]", re.IGNORECASE)
+               _compile_regex("some[0-9]", True)
+        obj = CommandStrategy("")
+        assert obj.get_regex_name("/test/g") == _compile_regex("test", False)
+        assert obj._is_regex_global
         obj = CommandStrategy("")
-        assert obj.get_regex_name("/test/g") == re.compile("test")
+        assert obj.get_regex_name("/$x+^/ig") == _compile_regex("$x+^", True)
         assert obj._is_regex_global
+
+    def test_global_flag_reset(self):
         obj = CommandStrategy("")
-        assert obj.get_regex_name("/$x+^/ig") == re.compile("$x+^", re.IGNORECASE)
+        obj.get_regex_name("/a/g")
         assert obj._is_regex_global
+        obj.get_regex_name("/a/")
+        assert not obj._is_regex_global
+
+    def test_escaped_slash(self):
+        obj = CommandStrategy("")
+        assert obj.get_regex_name("/a\\/b/") == _compile_regex("a/b", False)
+        assert not obj._is_regex_global
+        assert obj.get_regex_name("/a\\/gi/") == _compile_regex("a/gi", False)
+        assert not obj._is_regex_global
+
+
+class TestCompileRegex(object):
+    def test_compile(self):
+        assert _compile_regex("test.*", False).match("test something")
+        assert not _compile_regex("test.*", False).match("TEST")
+        assert _compile_regex("test.*", True).match("TEST")
+        assert _compile_regex(r"(a)\1", False).match("aa")
+
+    def test_cached(self):
+        assert _compile_regex("cached", False) is \
+               _compile_regex("cached", False)
+        assert _compile_regex("cached", False) is not \
+               _compile_regex("cached", True)
+
+
+class TestCompileRegexRe2(object):
+    @staticmethod
+    def get_re2():
+        re2 = pytest.importorskip("re2")
+        if not hasattr(re2, "Options"):
+            pytest.skip("module 're2' is not google-re2")
+        return re2
+
+    def test_compiled_with_re2(self):
+        self.get_re2()
+        regex = _compile_regex("re2.*test", False)
+        assert not isinstance(regex, type(re.compile("")))
+        assert regex.match("re2 test")
+        assert not regex.match("RE2 TEST")
+        assert _compile_regex("re2.*test", True).match("RE2 TEST")
+
+    def test_fallback(self):
+        self.get_re2()
+        assert isinstance(_compile_regex(r"(b)\1", False), type(re.compile("")))
+        regex = _compile_regex(r"caf\w", False)
+        assert isinstance(regex, type(re.compile("")))
+        assert regex.match(u"caf\u00e9")
+
+
+class TestGetLiteralPrefix(object):
+    def test_no_prefix(self):
+        assert _get_literal_prefix("") == ""
+        assert _get_literal_prefix(".*test") == ""
+        assert _get_literal_prefix("a*") == ""
+        assert _get_literal_prefix("test|other") == ""
+        assert _get_literal_prefix("(?i)test") == ""
+        assert _get_literal_prefix("ab(?i)") == ""
+        assert _get_literal_prefix("ab(?:c)") == ""
+
+    def test_prefix(self):
+        assert _get_literal_prefix("test") == "test"
+        assert _get_literal_prefix("^test") == "test"
+        assert _get_literal_prefix("foo_.*") == "foo_"
+        assert _get_literal_prefix("foo[0-9]") == "foo"
+        assert _get_literal_prefix("foo?") == "fo"
+        assert _get_literal_prefix("foo{2}") == "fo"
+        assert _get_literal_prefix("foo+") == "foo"
+        assert _get_literal_prefix("a\\d") == "a"
+
+    def test_stored(self):
+        obj = CommandStrategy("")
+        obj.get_regex_name("/foo_.*/")
+        assert obj._regex_prefix == "foo_"
+        obj.get_regex_name("/foo_.*/g")
+        assert obj._regex_prefix == ""
+        obj.get_regex_name("/foo_.*/i")
+        assert obj._regex_prefix == ""
 
 
 class TestNextMatchingUnitName(object):
-    pass # TODO
+    def test_match(self):
+        new_facade()
+        obj = CommandStrategy("")
+        regex = obj.get_regex_name("/tell/")
+        assert list(obj.next_matching_unit_name(UnitType.alias, regex)) == \
+               ["tell me"]
+        regex = obj.get_regex_name("/me/")
+        assert list(obj.next_matching_unit_name(UnitType.alias, regex)) == []
+
+    def test_search(self):
+        new_facade()
+        obj = CommandStrategy("")
+        regex = obj.get_regex_name("/me/g")
+        assert list(obj.next_matching_unit_name(UnitType.alias, regex)) == \
+               ["tell me"]
+        regex = obj.get_regex_name("/TOILET/ig")
+        assert \
+            sorted(obj.next_matching_unit_name(UnitType.intent, regex)) == \
+            ["ask_toilet"]
 
 class TestGetAllMatchingUnitNames(object):
-    pass # TODO
+    def test(self):
+        new_facade()
+        obj = CommandStrategy("")
+        regex = obj.get_regex_name("/(sorry|can)/")
+        assert \
+            sorted(obj.get_all_matching_unit_names(UnitType.alias, regex)) == \
+            ["can you", "sorry"]
+        regex = obj.get_regex_name("/nothing/")
+        assert obj.get_all_matching_unit_names(UnitType.slot, regex) == []
+
+    def test_delete_while_iterating(self):
+        new_facade()
+        obj = CommandStrategy("")
+        regex = obj.get_regex_name("/.*/")
+        for unit_name in obj.get_all_matching_unit_names(UnitType.alias, regex):
+            AST.get_or_create().delete_unit(UnitType.alias, unit_name)
+        assert len(AST.get_or_create()[UnitType.alias]) == 0
 
 
 class TestRemoveRedirectionTokens(object):
@@ -215,6 +355,24 @@ class TestRemoveRedirectionTokens(object):
         assert obj.command_tokens == ["test", "something", "/else/i"]
 
 
+class TestPrintWrapper(object):
+    def test_lazy(self):
+        obj = CommandStrategy("exit")
+        assert obj._print_wrapper is None
+        obj.flush_output()
+        assert obj._print_wrapper is None
+        assert obj.print_wrapper is obj.print_wrapper
+
+    def test_redirection(self):
+        assert CommandStrategy("exit").print_wrapper.get_redirection() is None
+        assert \
+            CommandStrategy("exit", quiet=True).print_wrapper.get_redirection() \
+            == (RedirectionType.quiet, None)
+        assert \
+            CommandStrategy("exit >> file.txt").print_wrapper.get_redirection() \
+            == (RedirectionType.append, "file.txt")
+
+
 class TestFlushOutput(object):
     # NOTE: for coverage
     def test_flush(self):